@@ -7,6 +7,8 @@ Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
 import typing
 from Parser import C_PUSH, C_POP, C_ARITHMETIC
+from RomReport import RomReport, parse_instructions
+from Profile import Profile
 import textwrap
 LOCAL = 'local'
 ARGUMENT = 'argument'
@@ -16,19 +18,39 @@ CONSTANT = 'constant'
 STATIC = 'static'
 POINTER = 'pointer'
 TEMP = 'temp'
+# OS calls that the fast math extension replaces with the mul and div commands.
+FAST_MATH_CALLS = {'Math.multiply': 'mul', 'Math.divide': 'div'}
 
 
 class CodeWriter:
     """Translates VM commands into Hack assembly code."""
 
-    def __init__(self, output_stream: typing.TextIO) -> None:
+    def __init__(self, output_stream: typing.TextIO,
+                 report: typing.Optional[RomReport] = None,
+                 profile: typing.Optional[Profile] = None,
+                 fast_math: bool = False) -> None:
         """Initializes the CodeWriter.
 
         Args:
             output_stream (typing.TextIO): output stream.
+            report (typing.Optional[RomReport]): if given, the size and cost
+            of every translated command is recorded in it.
+            profile (typing.Optional[Profile]): if given, comparisons and calls
+            are either instrumented with counters, or translated according to
+            how hot they are in the profile.
+            fast_math (bool): if True, calls to Math.multiply and Math.divide
+            are translated as the mul and div commands.
         """
         self.global_id = 0
         self.output_stream = output_stream
+        self.report = report
+        self.profile = profile
+        self.fast_math = fast_math
+        self.file_name = ""
+        self.current_function = ""
+        self.site_index = 0
+        self.shared_routines: typing.Set[str] = set()
+        self.shared_routine_choices: typing.Dict[str, bool] = {}
 
     def set_file_name(self, filename: str) -> None:
         """Informs the code writer that the translation of a new VM file is 
@@ -48,15 +70,131 @@ class CodeWriter:
         # the function "translate_file" in Main.py using python's os library,
         # For example, using code similar to:
         # input_filename, input_extension = os.path.splitext(os.path.basename(input_file.name))
-        pass
+        self.file_name = filename
+        # Commands outside of any function are attributed to the file itself.
+        self.current_function = filename
+        self.site_index = 0
 
-    def write_asm(self, assembly_command: str) -> None:
+    def write_asm(self, assembly_command: str, command_name: str = "") -> None:
+        if self.report is not None:
+            self.report.record(self.current_function, command_name, assembly_command)
         assembly_code_no_leading_spaces = ""
         lines = assembly_command.strip().split('\n')
         assembly_code_no_leading_spaces = '\n'.join(line.lstrip() for line in lines)
         self.output_stream.write(assembly_code_no_leading_spaces + "\n\n")
 
-    def write_arithmetic(self, arithmetic_command: str) -> None:
+    def profile_site(self, description: str) -> typing.Tuple[str, bool]:
+        """Names the next profiled site of the current function.
+
+        Args:
+            description (str): what the site is, e.g. "gt" or "call Foo.bar".
+
+        Returns:
+            typing.Tuple[str, bool]: the assembly code that counts the site's
+            executions (when instrumenting), and whether the site is hot
+            (always, unless a profile says otherwise).
+        """
+        if self.profile is None:
+            return "", True
+        self.site_index += 1
+        site = f"{self.current_function}#{self.site_index} {description}"
+        if not self.profile.instrumenting:
+            return "", self.profile.is_hot(site)
+        address = self.profile.add_site(site)
+        if address is None:
+            return "", True
+        # The counter stops at 65535 (-1) instead of wrapping around to 0.
+        self.global_id += 1
+        return f"""// profile {site}
+            @{address}
+            D=M+1
+            @PROFILE_SATURATED{self.global_id}
+            D;JEQ
+            @{address}
+            M=D
+            (PROFILE_SATURATED{self.global_id})
+            """, True
+
+    def shared_routine_pays_off(self, kind: str) -> bool:
+        """Decides whether the cold sites of a kind ("gt", "lt" or "call")
+        share a routine: only if, all together, they save more words than
+        the routine takes.
+
+        Args:
+            kind (str): the kind of the sites.
+
+        Returns:
+            bool: True if cold sites of this kind should use the routine.
+        """
+        if kind not in self.shared_routine_choices:
+            if kind == "call":
+                inline = self.inline_call("F", 0, "R")
+                shared = self.shared_call("F", 0, "R")
+                routine = self.shared_call_routine()
+            else:
+                inline = self.compare_with_signs(kind, 0)
+                shared = self.shared_comparison_call(kind, 0)
+                routine = self.shared_comparison_routine(kind)
+            saved = self.profile.cold_site_count(kind) * (
+                len(parse_instructions(inline)[0]) -
+                len(parse_instructions(shared)[0]))
+            # Execution jumps over the routine, which takes 2 more words.
+            self.shared_routine_choices[kind] = \
+                saved > len(parse_instructions(routine)[0]) + 2
+        return self.shared_routine_choices[kind]
+
+    def write_shared_routine(self, name: str, assembly_command: str) -> None:
+        """Writes a routine that cold sites share, the first time it is
+        needed. Execution jumps over it. Routines return to the address in
+        R15, unless they say otherwise.
+
+        Args:
+            name (str): the routine's label.
+            assembly_command (str): the routine's code.
+        """
+        if name in self.shared_routines:
+            return
+        self.shared_routines.add(name)
+        self.write_asm(f"""// shared routine {name}
+            @SKIP_{name}
+            0;JMP
+            ({name})
+            {assembly_command}
+            (SKIP_{name})""", "shared routine")
+
+    def write_shared_comparison(self, arithmetic_command: str) -> None:
+        """Writes a cold gt or lt as a call to a shared routine."""
+        self.write_shared_routine(
+            f"SHARED_{arithmetic_command.upper()}",
+            self.shared_comparison_routine(arithmetic_command))
+        self.global_id += 1
+        self.write_asm(
+            self.shared_comparison_call(arithmetic_command, self.global_id),
+            f"{arithmetic_command} (shared)")
+
+    def shared_comparison_routine(self, arithmetic_command: str) -> str:
+        name = f"SHARED_{arithmetic_command.upper()}"
+        return f"""
+            {self.compare_with_signs(arithmetic_command, "_" + name)}
+            // return
+            @R15
+            A=M
+            0;JMP"""
+
+    def shared_comparison_call(self, arithmetic_command: str, i: int) -> str:
+        return \
+            f"""// {arithmetic_command} (shared)
+                // R15 = return address
+                @SHARED_RETURN{i}
+                D=A
+                @R15
+                M=D
+                @SHARED_{arithmetic_command.upper()}
+                0;JMP
+                (SHARED_RETURN{i})"""
+
+    def write_arithmetic(self, arithmetic_command: str,
+                         no_overflow: bool = False) -> None:
         """Writes assembly code that is the translation of the given 
         arithmetic command. For the commands eq, lt, gt, you should correctly
         compare between all numbers our computer supports, and we define the
@@ -64,7 +202,18 @@ class CodeWriter:
 
         Args:
             command (str): an arithmetic command.
+            no_overflow (bool): for gt and lt, True if subtracting the operands
+            is known not to overflow (see RangeAnalysis), so the sign of the
+            difference can be used directly.
         """
+        # Only the long sign-split comparisons are worth profiling, the
+        # subtract-and-jump ones are always written inline.
+        profile_counter = ""
+        if arithmetic_command in ['gt', 'lt'] and not no_overflow:
+            profile_counter, hot = self.profile_site(arithmetic_command)
+            if not hot and self.shared_routine_pays_off(arithmetic_command):
+                self.write_shared_comparison(arithmetic_command)
+                return
         self.global_id += 1
         i = self.global_id
         assembly_command = ""
@@ -112,63 +261,23 @@ class CodeWriter:
                 // SP++
                 @SP
                 M=M+1"""
-        elif arithmetic_command in ['eq', 'gt', 'lt']:
+        elif arithmetic_command == 'eq' or \
+                (arithmetic_command in ['gt', 'lt'] and no_overflow):
+            # x - y is 0 exactly when x == y even if it overflows, so eq
+            # never needs to compare the signs first.
             sign = {'eq': "JEQ", 'gt': "JGT", 'lt': "JLT"}[arithmetic_command]
             assembly_command = \
                 f"""// {arithmetic_command}
-                // SP--
+                // D = y
                 @SP
-                M=M-1
-                // D = SP
-                A=M
+                AM=M-1
                 D=M
-                @R14 // *R14 = --SP
-                M=D
+                // D = x - y
                 @SP
-                M=M-1
-                A=M
-                D=M // D = --SP
-                @R13 // R13 = D
-                M=D
-
-                // Stack:
-                // R13: value1
-                // R14: value2
-                // SP -> __
-
-                // compare R13(=D for now) and R14
-                @D_is_positive{i}
-                D;JGT
-                @D_is_negative{i}
-                D;JLT
-                @Same_sign{i}
-                0;JMP
-
-                (D_is_positive{i})
-                    @R14 // D = R14
-                    D=M
-                    @Same_sign{i}
-                    D;JGT
-                    // R13 > 0 & R14 <= 0
-                    {f"@True{i}" if arithmetic_command == 'gt' else f"@False{i}"}
-                    0;JMP
-
-                (D_is_negative{i})
-                    @R14 // D = R14
-                    D=M
-                    @Same_sign{i}
-                    D;JLT
-                    // R13 < 0 & R14 >= 0   
-                    {f"@True{i}" if arithmetic_command == 'lt' else f"@False{i}"}
-                    0;JMP
-
-                (Same_sign{i})
-                    @R13 // D = R13
-                    D=M
-                    @R14 // M = R14
-                    D=D-M
-                    @True{i}
-                    D;{sign}
+                AM=M-1
+                D=M-D
+                @True{i}
+                D;{sign}
 
                 (False{i})
                     // False => SP = 0
@@ -177,18 +286,19 @@ class CodeWriter:
                     M=0
                     @End{i}
                     0;JMP
-                
+
                 (True{i})
                     // SP = -1
                     @SP
                     A=M
-                    M=1
-                    M=-M
+                    M=-1
 
                 (End{i})
                     // SP++
                     @SP
                     M=M+1"""
+        elif arithmetic_command in ['eq', 'gt', 'lt']:
+            assembly_command = self.compare_with_signs(arithmetic_command, i)
 
         elif arithmetic_command in ['neg', 'not']:
             sign = {'neg': "-", 'not': "!"}[arithmetic_command]
@@ -206,6 +316,8 @@ class CodeWriter:
                 @SP
                 M=M+1
                 """
+        elif arithmetic_command in ['mul', 'div']:
+            assembly_command = self.fast_math_call(arithmetic_command, i)
         elif arithmetic_command in ['shiftleft', 'shiftright']:
             if arithmetic_command == 'shiftleft':
                 assembly_command = \
@@ -276,10 +388,327 @@ class CodeWriter:
                             @SP     // SP++
                             M=M+1"""
 
-        self.write_asm(assembly_command)
+        self.write_asm(profile_counter + assembly_command, arithmetic_command)
         self.global_id += 1
 
-       
+    def fast_math_call(self, arithmetic_command: str, i: int) -> str:
+        # mul and div are shared routines with a register calling convention:
+        # x in R13, y in R14, the return address in R15 and the result in D.
+        # The routines use the free stack words at SP and above as scratch.
+        name = f"FAST_{arithmetic_command.upper()}"
+        self.write_shared_routine(name, {
+            'mul': self.fast_multiply, 'div': self.fast_divide}[
+                arithmetic_command]())
+        return \
+            f"""// {arithmetic_command}
+                // R14 = y
+                @SP
+                AM=M-1
+                D=M
+                @R14
+                M=D
+                // R13 = x
+                @SP
+                A=M-1
+                D=M
+                @R13
+                M=D
+                // R15 = return address
+                @{name}_RETURN{i}
+                D=A
+                @R15
+                M=D
+                @{name}
+                0;JMP
+                ({name}_RETURN{i})
+                // *(SP-1) = D
+                @SP
+                A=M-1
+                M=D"""
+
+    def fast_multiply(self) -> str:
+        # Shift-and-add: adds x * 2^k for every bit k that is set in y, and
+        # stops once no bits of y are left at or above the current one.
+        # A negative y has all high bits set, so both operands are negated
+        # first; x * y stays the same, modulo 2^16.
+        return \
+            """
+                // *(SP+1) = return address
+                @R15
+                D=M
+                @SP
+                A=M+1
+                M=D
+                // if y < 0: x = -x, y = -y
+                @R14
+                D=M
+                @FAST_MUL_START
+                D;JGE
+                @R14
+                M=-M
+                @R13
+                M=-M
+            (FAST_MUL_START)
+                // *SP = result = 0, R15 = mask = 1
+                @SP
+                A=M
+                M=0
+                @R15
+                M=1
+            (FAST_MUL_LOOP)
+                // if y & mask: result += x
+                @R14
+                D=M
+                @R15
+                D=D&M
+                @FAST_MUL_NEXT
+                D;JEQ
+                @R13
+                D=M
+                @SP
+                A=M
+                M=D+M
+            (FAST_MUL_NEXT)
+                // x += x
+                @R13
+                D=M
+                M=D+M
+                // mask += mask, stop once it overflows to 0
+                @R15
+                D=M
+                MD=D+M
+                @FAST_MUL_END
+                D;JEQ
+                // continue while y & -mask (y has bits at or above mask)
+                D=-D
+                @R14
+                D=D&M
+                @FAST_MUL_LOOP
+                D;JNE
+            (FAST_MUL_END)
+                // D = result, return
+                @SP
+                A=M
+                D=M
+                A=A+1
+                A=M
+                0;JMP"""
+
+    def fast_divide(self) -> str:
+        # Restoring division of |x| by |y|, rounding towards zero like
+        # Math.divide. R13 holds the dividend, which is shifted out to the
+        # left of the remainder (R15) one bit at a time, while the bits of
+        # the quotient are shifted into it from the right.
+        # Unlike Math.divide, division by zero does not call Sys.error, and
+        # gives a meaningless result.
+        return \
+            """
+                // *(SP+1) = return address
+                @R15
+                D=M
+                @SP
+                A=M+1
+                M=D
+                // *(SP+2) = negate the result?, R13 = |x|, R14 = |y|
+                @SP
+                A=M+1
+                A=A+1
+                M=0
+                @R13
+                D=M
+                @FAST_DIV_X_POSITIVE
+                D;JGE
+                @R13
+                M=-D
+                @SP
+                A=M+1
+                A=A+1
+                M=!M
+            (FAST_DIV_X_POSITIVE)
+                @R14
+                D=M
+                @FAST_DIV_Y_POSITIVE
+                D;JGE
+                @R14
+                M=-D
+                @SP
+                A=M+1
+                A=A+1
+                M=!M
+            (FAST_DIV_Y_POSITIVE)
+                // |y| = 32768 does not fit, the quotient is 1 if |x| = 32768
+                @R14
+                D=M
+                @FAST_DIV_START
+                D;JGE
+                @R13
+                D=M
+                M=0
+                @FAST_DIV_SIGN
+                D;JGE
+                @R13
+                M=1
+                @FAST_DIV_SIGN
+                0;JMP
+            (FAST_DIV_START)
+                // R15 = remainder = 0, *SP = bits left = 16
+                @R15
+                M=0
+                @16
+                D=A
+                @SP
+                A=M
+                M=D
+            (FAST_DIV_SKIP)
+                // shift out the leading 0 bits of the dividend
+                @R13
+                D=M
+                @FAST_DIV_LOOP
+                D;JLT
+                @R13
+                M=D+M
+                @SP
+                A=M
+                MD=M-1
+                @FAST_DIV_SKIP
+                D;JGT
+                @FAST_DIV_SIGN
+                0;JMP
+            (FAST_DIV_LOOP)
+                // remainder = 2 * remainder + the next bit of the dividend
+                @R15
+                D=M
+                M=D+M
+                @R13
+                D=M
+                M=D+M
+                @FAST_DIV_NO_CARRY
+                D;JGE
+                @R15
+                M=M+1
+            (FAST_DIV_NO_CARRY)
+                // if remainder >= |y| (unsigned): remainder -= |y|, R13++
+                @R15
+                D=M
+                @FAST_DIV_SUBTRACT
+                D;JLT
+                @R14
+                D=D-M
+                @FAST_DIV_NEXT
+                D;JLT
+            (FAST_DIV_SUBTRACT)
+                @R14
+                D=M
+                @R15
+                M=M-D
+                @R13
+                M=M+1
+            (FAST_DIV_NEXT)
+                @SP
+                A=M
+                MD=M-1
+                @FAST_DIV_LOOP
+                D;JGT
+            (FAST_DIV_SIGN)
+                // negate the quotient if needed
+                @SP
+                A=M+1
+                A=A+1
+                D=M
+                @FAST_DIV_RETURN
+                D;JEQ
+                @R13
+                M=-M
+            (FAST_DIV_RETURN)
+                // D = quotient, return
+                @R13
+                D=M
+                @SP
+                A=M+1
+                A=M
+                0;JMP"""
+
+    def compare_with_signs(self, arithmetic_command: str, i: typing.Any) -> str:
+        # Compares by the signs of the operands first, so that x - y is only
+        # computed when it cannot overflow. i makes the labels unique.
+        sign = {'eq': "JEQ", 'gt': "JGT", 'lt': "JLT"}[arithmetic_command]
+        assembly_command = \
+            f"""// {arithmetic_command}
+            // SP--
+            @SP
+            M=M-1
+            // D = SP
+            A=M
+            D=M
+            @R14 // *R14 = --SP
+            M=D
+            @SP
+            M=M-1
+            A=M
+            D=M // D = --SP
+            @R13 // R13 = D
+            M=D
+
+            // Stack:
+            // R13: value1
+            // R14: value2
+            // SP -> __
+
+            // compare R13(=D for now) and R14
+            @D_is_positive{i}
+            D;JGT
+            @D_is_negative{i}
+            D;JLT
+            @Same_sign{i}
+            0;JMP
+
+            (D_is_positive{i})
+                @R14 // D = R14
+                D=M
+                @Same_sign{i}
+                D;JGT
+                // R13 > 0 & R14 <= 0
+                {f"@True{i}" if arithmetic_command == 'gt' else f"@False{i}"}
+                0;JMP
+
+            (D_is_negative{i})
+                @R14 // D = R14
+                D=M
+                @Same_sign{i}
+                D;JLT
+                // R13 < 0 & R14 >= 0   
+                {f"@True{i}" if arithmetic_command == 'lt' else f"@False{i}"}
+                0;JMP
+
+            (Same_sign{i})
+                @R13 // D = R13
+                D=M
+                @R14 // M = R14
+                D=D-M
+                @True{i}
+                D;{sign}
+
+            (False{i})
+                // False => SP = 0
+                @SP
+                A=M
+                M=0
+                @End{i}
+                0;JMP
+            
+            (True{i})
+                // SP = -1
+                @SP
+                A=M
+                M=1
+                M=-M
+
+            (End{i})
+                // SP++
+                @SP
+                M=M+1"""
+        return assembly_command
+
     def write_push_pop(self, command: str, segment: str, index: int) -> None:
         """Writes assembly code that is the translation of the given 
         command, where command is either C_PUSH or C_POP.
@@ -306,7 +735,8 @@ class CodeWriter:
             assembly_command = self.write_temp(command, index)
         elif segment == POINTER:
             assembly_command = self.write_pointer(command, index)
-        self.write_asm(assembly_command)
+        self.write_asm(assembly_command,
+                       f"{'push' if command == C_PUSH else 'pop'} {segment}")
 
     def write_local_argument_this_that(self, command: str, segment: str, index: int) -> str:
         # VM:       push segment index
@@ -458,8 +888,8 @@ class CodeWriter:
                 M=D"""
         return assembly_command
 
-    def write_pointer(self, command: str, index: str) -> str:
-        pointer_name = {'0': 'THIS', '1': 'THAT'}[index]
+    def write_pointer(self, command: str, index: int) -> str:
+        pointer_name = {0: 'THIS', 1: 'THAT'}[int(index)]
         assembly_command = ""
         if command == C_PUSH:
             assembly_command = \
@@ -483,6 +913,19 @@ class CodeWriter:
         return assembly_command
 
 ##########################################################################################
+    def write_init(self) -> None:
+        """Writes the bootstrap code: sets SP to 256 and calls Sys.init."""
+        self.current_function = "bootstrap"
+        assembly_command = \
+            f"""// bootstrap
+                // SP = 256
+                @256
+                D=A
+                @SP
+                M=D"""
+        self.write_asm(assembly_command, "bootstrap")
+        self.write_call("Sys.init", 0)
+
     def write_label(self, label: str) -> None:
         """Writes assembly code that affects the label command. 
         Let "Xxx.foo" be a function within the file Xxx.vm. The handling of
@@ -494,9 +937,8 @@ class CodeWriter:
         Args:
             label (str): the label to write.
         """
-        # This is irrelevant for project 7,
-        # you will implement this in project 8!
-        pass
+        self.write_asm(f"""// label {label}
+            ({self.current_function}${label})""", "label")
     
     def write_goto(self, label: str) -> None:
         """Writes assembly code that affects the goto command.
@@ -504,9 +946,11 @@ class CodeWriter:
         Args:
             label (str): the label to go to.
         """
-        # This is irrelevant for project 7,
-        # you will implement this in project 8!
-        pass
+        assembly_command = \
+            f"""// goto {label}
+                @{self.current_function}${label}
+                0;JMP"""
+        self.write_asm(assembly_command, "goto")
     
     def write_if(self, label: str) -> None:
         """Writes assembly code that affects the if-goto command. 
@@ -514,9 +958,16 @@ class CodeWriter:
         Args:
             label (str): the label to go to.
         """
-        # This is irrelevant for project 7,
-        # you will implement this in project 8!
-        pass
+        assembly_command = \
+            f"""// if-goto {label}
+                // D = *(--SP)
+                @SP
+                AM=M-1
+                D=M
+                // jump if D != 0
+                @{self.current_function}${label}
+                D;JNE"""
+        self.write_asm(assembly_command, "if-goto")
     
     def write_function(self, function_name: str, n_vars: int) -> None:
         """Writes assembly code that affects the function command. 
@@ -530,13 +981,25 @@ class CodeWriter:
             function_name (str): the name of the function.
             n_vars (int): the number of local variables of the function.
         """
-        # This is irrelevant for project 7,
-        # you will implement this in project 8!
         # The pseudo-code of "function function_name n_vars" is:
         # (function_name)       // injects a function entry label into the code
         # repeat n_vars times:  // n_vars = number of local variables
         #   push constant 0     // initializes the local variables to 0
-        pass
+        self.current_function = function_name
+        self.site_index = 0
+        assembly_command = \
+            f"""// function {function_name} {n_vars}
+                ({function_name})"""
+        for i in range(n_vars):
+            assembly_command += \
+                f"""
+                // push constant 0
+                @SP
+                A=M
+                M=0
+                @SP
+                M=M+1"""
+        self.write_asm(assembly_command, "function")
     
     def write_call(self, function_name: str, n_args: int) -> None:
         """Writes assembly code that affects the call command. 
@@ -554,8 +1017,6 @@ class CodeWriter:
             function_name (str): the name of the function to call.
             n_args (int): the number of arguments of the function.
         """
-        # This is irrelevant for project 7,
-        # you will implement this in project 8!
         # The pseudo-code of "call function_name n_args" is:
         # push return_address   // generates a label and pushes it to the stack
         # push LCL              // saves LCL of the caller
@@ -566,12 +1027,304 @@ class CodeWriter:
         # LCL = SP              // repositions LCL
         # goto function_name    // transfers control to the callee
         # (return_address)      // injects the return address label into the code
-        pass
+        profile_counter, hot = self.profile_site(f"call {function_name}")
+        self.global_id += 1
+        return_address = f"{self.current_function}$ret.{self.global_id}"
+        if not hot and self.shared_routine_pays_off("call"):
+            self.write_shared_routine("SHARED_CALL", self.shared_call_routine())
+            self.write_asm(
+                self.shared_call(function_name, n_args, return_address),
+                "call (shared)")
+            return
+        self.write_asm(
+            profile_counter +
+            self.inline_call(function_name, n_args, return_address), "call")
+
+    def inline_call(self, function_name: str, n_args: int,
+                    return_address: str) -> str:
+        return \
+            f"""// call {function_name} {n_args}
+                // push return_address
+                @{return_address}
+                D=A
+                @SP
+                A=M
+                M=D
+                @SP
+                M=M+1
+                {self.push_frame_and_jump(function_name, n_args)}
+                ({return_address})"""
+
+    def shared_call(self, function_name: str, n_args: int,
+                    return_address: str) -> str:
+        # The frame is pushed by a shared routine, which gets the return
+        # address in R13, the callee in R14 and 5 + n_args in D.
+        return \
+            f"""// call {function_name} {n_args} (shared)
+                @{return_address}
+                D=A
+                @R13
+                M=D
+                @{function_name}
+                D=A
+                @R14
+                M=D
+                @{5 + n_args}
+                D=A
+                @SHARED_CALL
+                0;JMP
+                ({return_address})"""
+
+    def shared_call_routine(self) -> str:
+        return \
+            f"""
+                @R15
+                M=D
+                // push return_address
+                @R13
+                D=M
+                @SP
+                A=M
+                M=D
+                @SP
+                M=M+1
+                {self.push_frame()}
+                // ARG = SP-R15
+                @SP
+                D=M
+                @R15
+                D=D-M
+                @ARG
+                M=D
+                // LCL = SP
+                @SP
+                D=M
+                @LCL
+                M=D
+                // goto R14
+                @R14
+                A=M
+                0;JMP"""
+
+    def write_tail_call(self, function_name: str, n_args: int) -> None:
+        """Writes assembly code that affects a call command that is directly
+        followed by a return command. Instead of building a new frame on top
+        of the current one, the current frame is reused: the arguments are
+        moved down to where the current function's arguments start, and the
+        callee gets the current function's return address and saved caller
+        state. The callee then returns straight to the current function's
+        caller, so the stack does not grow with the depth of the recursion.
+
+        Args:
+            function_name (str): the name of the function to call.
+            n_args (int): the number of arguments of the function.
+        """
+        # The pseudo-code of "call function_name n_args; return" is:
+        # R14 = ARG                 // where our arguments, and our frame, start
+        # if LCL == ARG+5+n_args:   // we got n_args arguments too, so our
+        #                           // frame header is already where needed
+        #   move the n_args arguments from SP-n_args to R14
+        #   SP = LCL
+        #   goto function_name
+        # R13 = *(LCL-5)            // our return address, becomes the callee's
+        # *SP, *(SP+1) = *(LCL-2), *(LCL-1) // our caller's THIS and THAT,
+        # R15 = SP                  // kept above the stack, which the frame
+        #                           // that is built below never reaches
+        # ARG, LCL = *(LCL-3), *(LCL-4) // restores our caller's ARG and LCL
+        # move the n_args arguments from SP-n_args to R14
+        # SP = R14
+        # push R13, LCL, ARG, *R15, *(R15+1)
+        # ARG = SP-5-n_args; LCL = SP
+        # goto function_name
+        # THIS and THAT are left as they are, as in a plain call.
+        self.global_id += 1
+        i = self.global_id
+        assembly_command = \
+            f"""// call {function_name} {n_args} + return (tail call)
+                // R14 = ARG
+                @ARG
+                D=M
+                @R14
+                M=D
+                // if LCL != ARG+5+n_args, the frame header has to be rebuilt
+                @{5 + n_args}
+                D=D+A
+                @LCL
+                D=M-D
+                @NEW_FRAME{i}
+                D;JNE
+                {self.move_arguments(n_args)}
+                // SP = LCL
+                @LCL
+                D=M
+                @SP
+                M=D
+                // goto function_name
+                @{function_name}
+                0;JMP
+
+                (NEW_FRAME{i})
+                    // R13 = return_address = *(LCL-5)
+                    @LCL
+                    D=M
+                    @5
+                    A=D-A
+                    D=M
+                    @R13
+                    M=D
+                    // *SP = *(LCL-2), the caller's THIS
+                    @LCL
+                    D=M
+                    @2
+                    A=D-A
+                    D=M
+                    @SP
+                    A=M
+                    M=D
+                    // *(SP+1) = *(LCL-1), the caller's THAT
+                    @LCL
+                    A=M-1
+                    D=M
+                    @SP
+                    A=M+1
+                    M=D
+                    // R15 = SP
+                    @SP
+                    D=M
+                    @R15
+                    M=D
+                    // ARG = *(LCL-3)
+                    @LCL
+                    D=M
+                    @3
+                    A=D-A
+                    D=M
+                    @ARG
+                    M=D
+                    // LCL = *(LCL-4)
+                    @LCL
+                    D=M
+                    @4
+                    A=D-A
+                    D=M
+                    @LCL
+                    M=D
+                    {self.move_arguments(n_args)}
+                    // SP = R14
+                    @R14
+                    D=M
+                    @SP
+                    M=D
+                    // push return_address, LCL, ARG
+                    @R13
+                    D=M
+                    @SP
+                    A=M
+                    M=D
+                    @SP
+                    M=M+1
+                    {self.push_frame(["LCL", "ARG"])}
+                    // push *R15, *(R15+1), the caller's THIS and THAT
+                    @R15
+                    A=M
+                    D=M
+                    @SP
+                    A=M
+                    M=D
+                    @R15
+                    A=M+1
+                    D=M
+                    @SP
+                    M=M+1
+                    A=M
+                    M=D
+                    @SP
+                    M=M+1
+                    {self.enter_function(function_name, n_args)}"""
+        self.write_asm(assembly_command, "tail call")
+
+    def move_arguments(self, n_args: int) -> str:
+        # Moves the top n_args stack values down to where R14 points, leaving
+        # R14 right after them. The destination is below the source, so
+        # copying in increasing order never overwrites a value before it is
+        # copied.
+        assembly_command = ""
+        for i in range(n_args):
+            assembly_command += \
+                f"""
+                // *R14 = *(SP-{n_args - i}), R14++
+                @SP
+                D=M
+                @{n_args - i}
+                A=D-A
+                D=M
+                @R14
+                M=M+1
+                A=M-1
+                M=D"""
+        return assembly_command
+
+    def push_frame(self, pointers: typing.Sequence[str] =
+                   ("LCL", "ARG", "THIS", "THAT")) -> str:
+        # Pushes the given pointers, by default all of the caller's.
+        assembly_command = ""
+        for pointer in pointers:
+            assembly_command += \
+                f"""
+                // push {pointer}
+                @{pointer}
+                D=M
+                @SP
+                A=M
+                M=D
+                @SP
+                M=M+1"""
+        return assembly_command
+
+    def push_frame_and_jump(self, function_name: str, n_args: int) -> str:
+        # The part of a call that comes after pushing the return address.
+        return self.push_frame() + self.enter_function(function_name, n_args)
+
+    def enter_function(self, function_name: str, n_args: int) -> str:
+        # Points ARG and LCL at the frame that was just pushed, and jumps.
+        return \
+            f"""
+                // ARG = SP-5-n_args
+                @SP
+                D=M
+                @{5 + n_args}
+                D=D-A
+                @ARG
+                M=D
+                // LCL = SP
+                @SP
+                D=M
+                @LCL
+                M=D
+                // goto function_name
+                @{function_name}
+                0;JMP"""
+
+    def restore_segment_pointers(self, frame: str) -> str:
+        # THAT = *(frame-1), THIS = *(frame-2), ARG = *(frame-3),
+        # LCL = *(frame-4), reading the frame address from the given register.
+        # LCL is restored last, so it can be the frame register itself.
+        assembly_command = ""
+        for offset, pointer in enumerate(["THAT", "THIS", "ARG", "LCL"], 1):
+            assembly_command += \
+                f"""
+                // {pointer} = *(frame-{offset})
+                @{frame}
+                D=M
+                @{offset}
+                A=D-A
+                D=M
+                @{pointer}
+                M=D"""
+        return assembly_command
     
     def write_return(self) -> None:
         """Writes assembly code that affects the return command."""
-        # This is irrelevant for project 7,
-        # you will implement this in project 8!
         # The pseudo-code of "return" is:
         # frame = LCL                   // frame is a temporary variable
         # return_address = *(frame-5)   // puts the return address in a temp var
@@ -582,5 +1335,34 @@ class CodeWriter:
         # ARG = *(frame-3)              // restores ARG for the caller
         # LCL = *(frame-4)              // restores LCL for the caller
         # goto return_address           // go to the return address
-        pass
-
+        assembly_command = \
+            f"""// return
+                // R13 = frame = LCL
+                @LCL
+                D=M
+                @R13
+                M=D
+                // R14 = return_address = *(frame-5)
+                @5
+                A=D-A
+                D=M
+                @R14
+                M=D
+                // *ARG = pop()
+                @SP
+                AM=M-1
+                D=M
+                @ARG
+                A=M
+                M=D
+                // SP = ARG + 1
+                @ARG
+                D=M+1
+                @SP
+                M=D
+                {self.restore_segment_pointers("R13")}
+                // goto return_address
+                @R14
+                A=M
+                0;JMP"""
+        self.write_asm(assembly_command, "return")
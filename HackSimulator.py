@@ -0,0 +1,121 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from RomReport import parse_instructions
+PREDEFINED_SYMBOLS = {
+    'SP': 0, 'LCL': 1, 'ARG': 2, 'THIS': 3, 'THAT': 4,
+    'SCREEN': 16384, 'KBD': 24576,
+    **{f"R{i}": i for i in range(16)}}
+# The ALU computations, with "X" standing for A or M.
+COMPUTATIONS = {
+    '0': lambda d, x: 0, '1': lambda d, x: 1, '-1': lambda d, x: -1,
+    'D': lambda d, x: d, 'X': lambda d, x: x,
+    '!D': lambda d, x: ~d, '!X': lambda d, x: ~x,
+    '-D': lambda d, x: -d, '-X': lambda d, x: -x,
+    'D+1': lambda d, x: d + 1, 'X+1': lambda d, x: x + 1,
+    'D-1': lambda d, x: d - 1, 'X-1': lambda d, x: x - 1,
+    'D+X': lambda d, x: d + x, 'X+D': lambda d, x: d + x,
+    'D-X': lambda d, x: d - x, 'X-D': lambda d, x: x - d,
+    'D&X': lambda d, x: d & x, 'X&D': lambda d, x: d & x,
+    'D|X': lambda d, x: d | x, 'X|D': lambda d, x: d | x,
+}
+JUMPS = {
+    '': lambda value: False, 'JMP': lambda value: True,
+    'JEQ': lambda value: value == 0, 'JNE': lambda value: value != 0,
+    'JGT': lambda value: value > 0, 'JGE': lambda value: value >= 0,
+    'JLT': lambda value: value < 0, 'JLE': lambda value: value <= 0,
+}
+
+# An A-instruction is (None, value), a C-instruction is
+# (dest, computation, uses M, jump).
+Instruction = typing.Tuple[typing.Any, ...]
+
+
+def to_signed(value: int) -> int:
+    """
+    Returns:
+        int: the value as a 16 bit two's complement number.
+    """
+    value &= 0xFFFF
+    return value - 0x10000 if value & 0x8000 else value
+
+
+def assemble(assembly_code: str) -> typing.List[Instruction]:
+    """Translates Hack assembly code into a list of decoded instructions.
+
+    Args:
+        assembly_code (str): the assembly code.
+
+    Returns:
+        typing.List[Instruction]: the instructions.
+    """
+    instructions, labels = parse_instructions(assembly_code)
+    symbols = dict(PREDEFINED_SYMBOLS, **labels)
+    next_variable = 16
+    program = []
+    for instruction in instructions:
+        instruction = instruction.replace(' ', '')
+        if instruction.startswith('@'):
+            symbol = instruction[1:]
+            if not symbol.isdigit() and symbol not in symbols:
+                symbols[symbol] = next_variable
+                next_variable += 1
+            program.append((None, int(symbol) if symbol.isdigit()
+                            else symbols[symbol]))
+            continue
+        dest, computation, jump = '', instruction, ''
+        if '=' in computation:
+            dest, computation = computation.split('=', 1)
+        if ';' in computation:
+            computation, jump = computation.split(';', 1)
+        uses_m = 'M' in computation
+        computation = computation.replace('M' if uses_m else 'A', 'X')
+        if computation not in COMPUTATIONS or jump not in JUMPS:
+            raise Exception(f"invalid instruction '{instruction}'")
+        program.append((dest, COMPUTATIONS[computation], uses_m, JUMPS[jump]))
+    return program
+
+
+def run(program: typing.List[Instruction], ram: typing.Dict[int, int],
+        max_cycles: int) -> int:
+    """Runs a program from address 0 until it leaves the ROM, reaches an
+    endless "@L, (L) 0;JMP" loop or runs for max_cycles cycles.
+
+    Args:
+        program (typing.List[Instruction]): the assembled program.
+        ram (typing.Dict[int, int]): the RAM, changed in place. Missing
+        addresses hold 0.
+        max_cycles (int): the maximal number of cycles to run.
+
+    Returns:
+        int: the number of cycles that ran.
+    """
+    a_register = d_register = pc = cycles = 0
+    while 0 <= pc < len(program) and cycles < max_cycles:
+        cycles += 1
+        instruction = program[pc]
+        if instruction[0] is None:
+            a_register = instruction[1]
+            pc += 1
+            continue
+        dest, computation, uses_m, jump = instruction
+        value = to_signed(computation(
+            d_register, ram.get(a_register, 0) if uses_m else a_register))
+        if 'M' in dest:
+            ram[a_register] = value
+        if 'D' in dest:
+            d_register = value
+        if jump(value):
+            if a_register == pc - 1 and program[pc - 1] == (None, pc - 1):
+                break
+            pc = a_register
+        else:
+            pc += 1
+        if 'A' in dest:
+            a_register = value
+    return cycles
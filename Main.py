@@ -8,29 +8,107 @@ Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 import os
 import sys
 import typing
-from Parser import Parser, C_PUSH, C_POP, C_ARITHMETIC
-from CodeWriter import CodeWriter
+from Parser import MappedParser, C_PUSH, C_POP, C_ARITHMETIC, C_LABEL, \
+    C_GOTO, C_IF, C_FUNCTION, C_RETURN, C_CALL
+from CodeWriter import CodeWriter, FAST_MATH_CALLS
+from RomReport import RomReport
+from RangeAnalysis import Command, safe_comparisons
+from Profile import Profile
+REPORT_OPTION = '--report'
+PROFILE_GENERATE_OPTION = '--profile-generate'
+PROFILE_USE_OPTION = '--profile-use'
+FAST_MATH_OPTION = '--fast-math'
+OPTIONS = [REPORT_OPTION, PROFILE_GENERATE_OPTION, PROFILE_USE_OPTION,
+           FAST_MATH_OPTION]
+# Longer functions are translated without the range analysis, in parts of
+# this many commands, so that the buffered commands take bounded memory.
+MAX_ANALYZED_COMMANDS = 100000
 
 
 def translate_file(
-        input_file: typing.TextIO, output_file: typing.TextIO) -> None:
-    """Translates a single file.
+        input_file: typing.TextIO, output_file: typing.TextIO,
+        code_writer: typing.Optional[CodeWriter] = None) -> None:
+    """Translates a single file. The commands of each function are read into
+    a buffer, analysed (see RangeAnalysis) and translated before the next
+    function is read, so the file is only read once.
 
     Args:
-        input_file (typing.TextIO): the file to translate.
+        input_file (typing.TextIO): the file to translate. Its name, if it
+        has one, names the code outside of functions.
         output_file (typing.TextIO): writes all output to this file.
+        code_writer (typing.Optional[CodeWriter]): the code writer to use, so
+        that all files of a directory share it. A new one by default.
     """
     # Your code goes here!
     # It might be good to start with something like:
-    parser = Parser(input_file)
-    code_writer = CodeWriter(output_file)
-    while parser.has_more_commands():
-        if parser.command_type() == C_PUSH or parser.command_type() == C_POP:
-            code_writer.write_push_pop(parser.command_type(), parser.arg1(), parser.arg2())
-        elif parser.command_type() == C_ARITHMETIC:
-            code_writer.write_arithmetic(parser.arg1())
-        parser.advance()
-    
+    if code_writer is None:
+        code_writer = CodeWriter(output_file)
+    input_filename, input_extension = os.path.splitext(
+        os.path.basename(getattr(input_file, 'name', "")))
+    code_writer.set_file_name(input_filename)
+    commands: typing.List[Command] = []
+    # False once a function was cut into parts, as the analysis of a part
+    # would miss the jumps from the other parts.
+    whole_function = True
+    with MappedParser(input_file) as parser:
+        while parser.has_more_commands():
+            command_type = parser.command_type()
+            if command_type == C_FUNCTION and commands:
+                translate_function(commands, code_writer, whole_function)
+                commands = []
+                whole_function = True
+            elif len(commands) == MAX_ANALYZED_COMMANDS:
+                translate_function(commands, code_writer, False)
+                commands = []
+                whole_function = False
+            commands.append((
+                command_type,
+                parser.arg1() if command_type != C_RETURN else None,
+                parser.arg2() if command_type in [C_PUSH, C_POP, C_FUNCTION,
+                                                  C_CALL] else None))
+            parser.advance()
+    translate_function(commands, code_writer, whole_function)
+
+
+def translate_function(commands: typing.List[Command],
+                       code_writer: CodeWriter, analyze: bool) -> None:
+    """Translates the buffered commands of a function.
+
+    Args:
+        commands (typing.List[Command]): the commands.
+        code_writer (CodeWriter): writes the translation.
+        analyze (bool): whether the commands are a whole function, so that
+        the range analysis can run on them.
+    """
+    no_overflow = safe_comparisons(commands) if analyze else set()
+    index = 0
+    while index < len(commands):
+        command_type, arg1, arg2 = commands[index]
+        if command_type == C_PUSH or command_type == C_POP:
+            code_writer.write_push_pop(command_type, arg1, arg2)
+        elif command_type == C_ARITHMETIC:
+            code_writer.write_arithmetic(arg1, index in no_overflow)
+        elif command_type == C_LABEL:
+            code_writer.write_label(arg1)
+        elif command_type == C_GOTO:
+            code_writer.write_goto(arg1)
+        elif command_type == C_IF:
+            code_writer.write_if(arg1)
+        elif command_type == C_FUNCTION:
+            code_writer.write_function(arg1, arg2)
+        elif command_type == C_CALL and code_writer.fast_math \
+                and arg1 in FAST_MATH_CALLS and arg2 == 2:
+            code_writer.write_arithmetic(FAST_MATH_CALLS[arg1])
+        elif command_type == C_CALL:
+            if index + 1 < len(commands) and \
+                    commands[index + 1][0] == C_RETURN:
+                code_writer.write_tail_call(arg1, arg2)
+                index += 1
+            else:
+                code_writer.write_call(arg1, arg2)
+        elif command_type == C_RETURN:
+            code_writer.write_return()
+        index += 1
 
 
 if "__main__" == __name__:
@@ -39,8 +117,13 @@ if "__main__" == __name__:
     # Both are closed automatically when the code finishes running.
     # If the output file does not exist, it is created automatically in the
     # correct path, using the correct filename.
-    if not len(sys.argv) == 2:
-        sys.exit("Invalid usage, please use: VMtranslator <input path>")
+    options = sys.argv[2:]
+    if len(sys.argv) < 2 or any(option not in OPTIONS for option in options) \
+            or (PROFILE_GENERATE_OPTION in options
+                and PROFILE_USE_OPTION in options):
+        sys.exit("Invalid usage, please use: VMtranslator <input path> "
+                 f"[{REPORT_OPTION}] [{FAST_MATH_OPTION}] "
+                 f"[{PROFILE_GENERATE_OPTION} | {PROFILE_USE_OPTION}]")
     argument_path = os.path.abspath(sys.argv[1])
     if os.path.isdir(argument_path):
         files_to_translate = [
@@ -51,11 +134,34 @@ if "__main__" == __name__:
     else:
         files_to_translate = [argument_path]
         output_path, extension = os.path.splitext(argument_path)
+    sites_path = output_path + ".sites"
+    profile_path = output_path + ".profile"
+    profile = None
+    if PROFILE_GENERATE_OPTION in options:
+        profile = Profile()
+    elif PROFILE_USE_OPTION in options:
+        if not os.path.exists(profile_path):
+            sys.exit(f"{profile_path} not found, please create it with "
+                     f"{PROFILE_GENERATE_OPTION} and Profile.py first")
+        profile = Profile.read(profile_path)
     output_path += ".asm"
+    report = RomReport()
     with open(output_path, 'w') as output_file:
+        code_writer = CodeWriter(output_file, report, profile,
+                                 FAST_MATH_OPTION in options)
+        if any(os.path.basename(input_path) == "Sys.vm"
+               for input_path in files_to_translate):
+            code_writer.write_init()
         for input_path in files_to_translate:
             filename, extension = os.path.splitext(input_path)
             if extension.lower() != ".vm":
                 continue
             with open(input_path, 'r') as input_file:
-                translate_file(input_file, output_file)
+                translate_file(input_file, output_file, code_writer)
+    if PROFILE_GENERATE_OPTION in options:
+        profile.write_sites(sites_path)
+    if REPORT_OPTION in options:
+        print(report.format())
+    rom_warning = report.rom_warning()
+    if rom_warning is not None:
+        print(rom_warning, file=sys.stderr)
@@ -5,10 +5,19 @@ was written by Aviv Yaish. It is an extension to the specifications given
 as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import mmap
+import re
+import sys
 import typing
 C_PUSH = 'C_PUSH'
 C_POP = 'C_POP'
 C_ARITHMETIC = 'C_ARITHMETIC'
+C_LABEL = 'C_LABEL'
+C_GOTO = 'C_GOTO'
+C_IF = 'C_IF'
+C_FUNCTION = 'C_FUNCTION'
+C_RETURN = 'C_RETURN'
+C_CALL = 'C_CALL'
 
 
 class Parser:
@@ -33,6 +42,7 @@ class Parser:
     - Arithmetic commands:
       - add, sub, and, or, eq, gt, lt
       - neg, not, shiftleft, shiftright
+      - mul, div (an extension, see CodeWriter.fast_math_call)
     - Memory segment manipulation:
       - push <segment> <number>
       - pop <segment that is not constant> <number>
@@ -110,7 +120,7 @@ class Parser:
             return C_PUSH
         elif self.current_command.startswith('pop'):
             return C_POP
-        for arithmetic in ['add', 'sub', 'and', 'or', 'eq', 'gt', 'lt', 'neg', 'not', 'shiftleft', 'shiftright']:
+        for arithmetic in ['add', 'sub', 'and', 'or', 'eq', 'gt', 'lt', 'neg', 'not', 'shiftleft', 'shiftright', 'mul', 'div']:
             if self.current_command.startswith(arithmetic):
                 return C_ARITHMETIC
         
@@ -139,4 +149,186 @@ class Parser:
             current_command_words = self.current_command.split()
             return current_command_words[2]
             
-# test()
\ No newline at end of file
+# test()
+
+
+# Maps the raw bytes of a command word to its command type. The values are the
+# module constants above, so looking one up never allocates a new string.
+_COMMAND_TYPES = {
+    b'push': C_PUSH, b'pop': C_POP,
+    b'label': C_LABEL, b'goto': C_GOTO, b'if-goto': C_IF,
+    b'function': C_FUNCTION, b'call': C_CALL, b'return': C_RETURN,
+}
+_ARITHMETIC_COMMANDS = {
+    word.encode(): word for word in
+    ['add', 'sub', 'and', 'or', 'eq', 'gt', 'lt',
+     'neg', 'not', 'shiftleft', 'shiftright', 'mul', 'div']}
+_SEGMENTS = {
+    word.encode(): word for word in
+    ['argument', 'local', 'static', 'constant',
+     'this', 'that', 'pointer', 'temp']}
+
+# Whether each command type takes a first and a second argument.
+_OPERANDS = {
+    C_ARITHMETIC: (False, False), C_RETURN: (False, False),
+    C_LABEL: (True, False), C_GOTO: (True, False), C_IF: (True, False),
+    C_PUSH: (True, True), C_POP: (True, True),
+    C_FUNCTION: (True, True), C_CALL: (True, True),
+}
+
+# A single VM command: a command word, then up to two arguments separated by
+# non-newline whitespace. The rest of the line may only hold whitespace and a
+# comment, which is checked without capturing it; only when that check fails
+# is the rest captured, for the error message. Lines that hold nothing else
+# (blank lines and comment lines) never match, since "^" only matches at the
+# start of a line.
+_COMMAND_LINE = re.compile(
+    rb'^[ \t\r\f\v]*((?:[^\s/]|/(?!/))+)'
+    rb'(?:[ \t\r\f\v]+((?:[^\s/]|/(?!/))+))?'
+    rb'(?:[ \t\r\f\v]+([0-9]+))?'
+    rb'(?:(?=[ \t\r\f\v]*(?://|$))|([^\n]*))',
+    re.MULTILINE)
+
+
+class MappedParser:
+    """
+    # MappedParser
+
+    Same interface as Parser, but instead of decoding the whole file and
+    building a list of cleaned lines, it memory-maps the .vm file and scans
+    its bytes in place, one command at a time. For every command, only the
+    command type, the argument number and the (interned) first argument are
+    kept, so translating very large files does not churn through a string
+    object per line, word and comment.
+
+    The mapping is released by close(), or by using the parser as a context
+    manager.
+    """
+
+    def __init__(self, input_file: typing.IO) -> None:
+        """Gets ready to parse the input file.
+
+        Args:
+            input_file (typing.IO): input file. Anything that cannot be
+            memory-mapped (an empty file, an in-memory stream) is read whole.
+        """
+        try:
+            self.buffer = mmap.mmap(
+                input_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError):
+            # io.UnsupportedOperation is both an OSError and a ValueError.
+            self.buffer = input_file.read()
+            if isinstance(self.buffer, str):
+                self.buffer = self.buffer.encode()
+        self.commands = _COMMAND_LINE.finditer(self.buffer)
+        self.names: typing.Dict[bytes, str] = {}
+        self.current_type: typing.Optional[str] = None
+        self.current_arg1: typing.Optional[str] = None
+        self.current_arg2: typing.Optional[int] = None
+        self.advance()
+
+    def has_more_commands(self) -> bool:
+        """Are there more commands in the input?
+
+        Returns:
+            bool: True if there are more commands, False otherwise.
+        """
+        return self.current_type is not None
+
+    def advance(self) -> None:
+        """Reads the next command from the input and makes it the current
+        command. Should be called only if has_more_commands() is true.
+        """
+        match = next(self.commands, None)
+        if match is None:
+            self.current_type = None
+            return
+        word, arg1, arg2, unexpected = match.groups()
+        if word in _ARITHMETIC_COMMANDS:
+            self.current_type = C_ARITHMETIC
+        elif word in _COMMAND_TYPES:
+            self.current_type = _COMMAND_TYPES[word]
+        else:
+            self.error(match, f"unknown command '{word.decode()}'")
+        if unexpected is not None:
+            self.error(match, f"unexpected '{unexpected.strip().decode()}'")
+        if _OPERANDS[self.current_type] != (arg1 is not None, arg2 is not None):
+            self.error(match, "wrong number of arguments")
+        if self.current_type == C_ARITHMETIC:
+            self.current_arg1 = _ARITHMETIC_COMMANDS[word]
+        elif self.current_type in [C_PUSH, C_POP]:
+            if arg1 not in _SEGMENTS or \
+                    (self.current_type == C_POP and arg1 == b'constant'):
+                self.error(match, f"invalid segment '{arg1.decode()}'")
+            self.current_arg1 = _SEGMENTS[arg1]
+        else:
+            self.current_arg1 = None if arg1 is None else \
+                self.intern_name(arg1)
+        self.current_arg2 = None if arg2 is None else int(arg2)
+
+    def close(self) -> None:
+        """Releases the memory-mapped input. The parser cannot be used
+        afterwards."""
+        # The match iterator holds on to the buffer, so it goes first.
+        self.commands = iter(())
+        self.current_type = None
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+    def __enter__(self) -> "MappedParser":
+        return self
+
+    def __exit__(self, *exc_info: typing.Any) -> None:
+        self.close()
+
+    def error(self, match: typing.Match, message: str) -> None:
+        """Raises an error about the command that was just matched.
+
+        Args:
+            match (typing.Match): the command's match.
+            message (str): what is wrong with it.
+        """
+        line = self.buffer[:match.start()].count(b'\n') + 1
+        command = match.group(0).strip().decode()
+        raise Exception(f"{message} in '{command}' in line {line}")
+
+    def intern_name(self, name: bytes) -> str:
+        """Decodes a label or function name once, and returns the same
+        interned string every time it appears again in the file.
+
+        Args:
+            name (bytes): the raw bytes of the name.
+
+        Returns:
+            str: the interned name.
+        """
+        interned = self.names.get(name)
+        if interned is None:
+            interned = sys.intern(name.decode())
+            self.names[name] = interned
+        return interned
+
+    def command_type(self) -> str:
+        """
+        Returns:
+            str: the type of the current VM command, as in Parser.
+        """
+        return self.current_type
+
+    def arg1(self) -> str:
+        """
+        Returns:
+            str: the first argument of the current command. In case of
+            "C_ARITHMETIC", the command itself (add, sub, etc.) is returned.
+            Should not be called if the current command is "C_RETURN".
+        """
+        return self.current_arg1
+
+    def arg2(self) -> int:
+        """
+        Returns:
+            int: the second argument of the current command. Should be
+            called only if the current command is "C_PUSH", "C_POP",
+            "C_FUNCTION" or "C_CALL".
+        """
+        return self.current_arg2
@@ -0,0 +1,167 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import os
+import sys
+import typing
+import HackSimulator
+# The profile counters live right after the keyboard register, where no Hack
+# program keeps anything (the heap, the stack, the statics and the screen are
+# all below the keyboard). Only HackSimulator runs instrumented programs, and
+# it has RAM at every address up to 32767.
+PROFILE_BASE = HackSimulator.PREDEFINED_SYMBOLS['KBD'] + 1
+MAX_SITES = 1024
+# The hot sites are the busiest ones that together make up this share of all
+# the executions that were counted.
+HOT_COVERAGE = 0.99
+DEFAULT_MAX_CYCLES = 100000000
+
+
+class Profile:
+    """
+    # Profile
+
+    Profile-guided code generation works in two translations:
+    1. "VMtranslator <path> --profile-generate": CodeWriter gives every
+       profiled site (a comparison or a call) a counter in RAM, starting at
+       PROFILE_BASE, increments it whenever the site runs, and the site names
+       are written to Xxx.sites.
+    2. "python3 Profile.py Xxx.asm" runs the program in HackSimulator and
+       writes each site's count to Xxx.profile.
+    3. "VMtranslator <path> --profile-use": CodeWriter reads Xxx.profile and
+       emits fast inline code for hot sites, and small calls to shared
+       routines for cold ones.
+
+    A site is named after its function and its position in the function, so
+    a profile stays valid for functions that did not change.
+
+    Each counter is a single word that stops at 65535, so sites that ran at
+    least that many times all count as 65535.
+    """
+
+    def __init__(self, counts: typing.Optional[typing.Dict[str, int]] = None) \
+            -> None:
+        """
+        Args:
+            counts (typing.Optional[typing.Dict[str, int]]): the count of each
+            site, when using a profile. None when generating one.
+        """
+        self.instrumenting = counts is None
+        self.sites: typing.List[str] = []
+        self.counts = counts if counts is not None else {}
+        self.hot_sites = set()
+        total = sum(self.counts.values())
+        covered = 0
+        for site, count in sorted(self.counts.items(),
+                                  key=lambda item: item[1], reverse=True):
+            if count == 0 or covered >= total * HOT_COVERAGE:
+                break
+            self.hot_sites.add(site)
+            covered += count
+
+    def add_site(self, site: str) -> typing.Optional[int]:
+        """Allocates a counter to a site.
+
+        Args:
+            site (str): the site's name.
+
+        Returns:
+            typing.Optional[int]: the counter's RAM address, or None if all
+            the counters are taken (the site is then not profiled).
+        """
+        if len(self.sites) == MAX_SITES:
+            return None
+        self.sites.append(site)
+        return PROFILE_BASE + len(self.sites) - 1
+
+    def is_hot(self, site: str) -> bool:
+        """
+        Returns:
+            bool: True if the site is hot, or if the profile has no
+            information about it.
+        """
+        return site in self.hot_sites or site not in self.counts
+
+    def cold_site_count(self, kind: str) -> int:
+        """
+        Args:
+            kind (str): the first word of the sites' description, e.g. "gt"
+            or "call".
+
+        Returns:
+            int: the number of cold sites of that kind in the profile.
+        """
+        return sum(1 for site in self.counts
+                   if site not in self.hot_sites
+                   and site.split(" ")[1] == kind)
+
+    def write_sites(self, sites_path: str) -> None:
+        """Writes the names of the sites, in the order of their counters."""
+        with open(sites_path, 'w') as sites_file:
+            sites_file.writelines(site + "\n" for site in self.sites)
+
+    @staticmethod
+    def read(profile_path: str) -> "Profile":
+        """Reads a profile written by dump_counters.
+
+        Args:
+            profile_path (str): the path of the Xxx.profile file.
+
+        Returns:
+            Profile: the profile.
+        """
+        counts = {}
+        with open(profile_path, 'r') as profile_file:
+            for line in profile_file:
+                count, site = line.rstrip("\n").split(" ", 1)
+                counts[site] = int(count)
+        return Profile(counts)
+
+
+def dump_counters(asm_path: str, max_cycles: int,
+                  ram: typing.Dict[int, int]) -> str:
+    """Runs an instrumented program and writes the counters of its sites to
+    a profile file next to it.
+
+    Args:
+        asm_path (str): the instrumented Xxx.asm file. Its site names are
+        read from Xxx.sites.
+        max_cycles (int): the maximal number of cycles to run.
+        ram (typing.Dict[int, int]): the initial RAM contents.
+
+    Returns:
+        str: the path of the profile file.
+    """
+    base_path, extension = os.path.splitext(asm_path)
+    with open(asm_path, 'r') as asm_file:
+        program = HackSimulator.assemble(asm_file.read())
+    with open(base_path + ".sites", 'r') as sites_file:
+        sites = [line.rstrip("\n") for line in sites_file]
+    HackSimulator.run(program, ram, max_cycles)
+    with open(base_path + ".profile", 'w') as profile_file:
+        for index, site in enumerate(sites):
+            # The counters are unsigned, and stop at 65535.
+            count = ram.get(PROFILE_BASE + index, 0) & 0xFFFF
+            profile_file.write(f"{count} {site}\n")
+    return base_path + ".profile"
+
+
+if "__main__" == __name__:
+    # Runs an instrumented program, e.g. "Profile.py Xxx.asm 5000000 0=256",
+    # and writes Xxx.profile. RAM contents can be set as address=value.
+    if len(sys.argv) < 2:
+        sys.exit("Invalid usage, please use: Profile.py <asm path> "
+                 "[max cycles] [address=value ...]")
+    arguments = sys.argv[2:]
+    max_cycles = DEFAULT_MAX_CYCLES
+    if arguments and '=' not in arguments[0]:
+        max_cycles = int(arguments.pop(0))
+    initial_ram = {}
+    for argument in arguments:
+        address, value = argument.split('=')
+        initial_ram[int(address)] = int(value)
+    print(dump_counters(sys.argv[1], max_cycles, initial_ram))
@@ -0,0 +1,345 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from Parser import C_PUSH, C_POP, C_ARITHMETIC, C_LABEL, C_GOTO, C_IF, \
+    C_FUNCTION, C_RETURN, C_CALL
+MIN_VALUE = -32768
+MAX_VALUE = 32767
+# Segments whose cells are tracked. A write to "this", "that" or "pointer" is
+# assumed not to alias them, as the VM segments are distinct. Statics and
+# temps are shared with the callees, so they are forgotten after each call.
+TRACKED_SEGMENTS = ['local', 'argument', 'static', 'temp']
+CALL_CLOBBERED_SEGMENTS = ['static', 'temp']
+# After this many updates of a label's state, growing bounds jump straight to
+# the limits of the 16 bit range, so that every loop reaches a fixpoint.
+WIDENING_THRESHOLD = 5
+# "x gt y" is "y lt x", so a condition on the second operand flips.
+FLIPPED = {'eq': 'eq', 'gt': 'lt', 'lt': 'gt'}
+
+# (command type, arg1, arg2) of a parsed VM command.
+Command = typing.Tuple[str, typing.Optional[str], typing.Optional[int]]
+Cell = typing.Tuple[str, int]
+# (cell, relation, low, high, negated): the cell's value is in relation to
+# some value between low and high, or is not if negated.
+Condition = typing.Tuple[Cell, str, int, int, bool]
+
+
+class Value(typing.NamedTuple):
+    """An abstract stack value: an interval of possible values, the cell it
+    was pushed from (if it is still unchanged) and, for comparison results,
+    the condition it stands for."""
+    low: int
+    high: int
+    cell: typing.Optional[Cell] = None
+    condition: typing.Optional[Condition] = None
+
+
+TOP = Value(MIN_VALUE, MAX_VALUE)
+BOOLEAN = Value(-1, 0)
+
+
+def interval(low: int, high: int) -> Value:
+    """
+    Returns:
+        Value: the interval [low, high], or TOP if it does not fit in 16 bits
+        (the result wrapped around and can be anything).
+    """
+    if low < MIN_VALUE or high > MAX_VALUE:
+        return TOP
+    return Value(low, high)
+
+
+def comparison_is_safe(x: Value, y: Value) -> bool:
+    """
+    Returns:
+        bool: True if "x - y" cannot overflow, so "x gt y" and "x lt y" can be
+        computed from the sign of the subtraction.
+    """
+    return x.low - y.high >= MIN_VALUE and x.high - y.low <= MAX_VALUE
+
+
+class State:
+    """The abstract machine state at some point of a function: the known part
+    of the top of the stack, and the ranges of the tracked cells. Cells that
+    are missing can hold any value."""
+
+    def __init__(self, stack: typing.Optional[typing.List[Value]] = None,
+                 cells: typing.Optional[
+                     typing.Dict[Cell, typing.Tuple[int, int]]] = None) -> None:
+        self.stack = stack if stack is not None else []
+        self.cells = cells if cells is not None else {}
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, State) and self.stack == other.stack \
+            and self.cells == other.cells
+
+    def copy(self) -> "State":
+        return State(list(self.stack), dict(self.cells))
+
+    def push(self, value: Value) -> None:
+        self.stack.append(value)
+
+    def pop(self) -> Value:
+        # Values pushed before the analyzed code started are unknown.
+        return self.stack.pop() if self.stack else TOP
+
+    def load(self, cell: Cell) -> Value:
+        low, high = self.cells.get(cell, (MIN_VALUE, MAX_VALUE))
+        return Value(low, high, cell)
+
+    def store(self, cell: Cell, value: Value) -> None:
+        self.forget(lambda other: other == cell)
+        self.cells[cell] = (value.low, value.high)
+
+    def forget(self, is_forgotten: typing.Callable[[Cell], bool]) -> None:
+        """Forgets the given cells, and every stack value that refers to
+        their old contents."""
+        for cell in [cell for cell in self.cells if is_forgotten(cell)]:
+            del self.cells[cell]
+        for index, value in enumerate(self.stack):
+            if value.cell is not None and is_forgotten(value.cell):
+                value = value._replace(cell=None)
+            if value.condition is not None and is_forgotten(value.condition[0]):
+                value = value._replace(condition=None)
+            self.stack[index] = value
+
+    def refine(self, condition: Condition, holds: bool) -> bool:
+        """Narrows the range of a cell, knowing whether a condition on it
+        holds.
+
+        Returns:
+            bool: False if this is impossible (the branch is never taken).
+        """
+        cell, relation, low, high, negated = condition
+        low_bound, high_bound = self.cells.get(cell, (MIN_VALUE, MAX_VALUE))
+        if holds != negated:
+            if relation in ['lt', 'eq']:
+                high_bound = min(high_bound, high - (relation == 'lt'))
+            if relation in ['gt', 'eq']:
+                low_bound = max(low_bound, low + (relation == 'gt'))
+        elif relation == 'lt':
+            low_bound = max(low_bound, low)
+        elif relation == 'gt':
+            high_bound = min(high_bound, high)
+        if low_bound > high_bound:
+            return False
+        self.cells[cell] = (low_bound, high_bound)
+        return True
+
+    def join(self, other: "State", widen: bool = False) -> "State":
+        """
+        Returns:
+            State: a state that covers both this state and the other one. If
+            widen is set, bounds that grew past this state's are dropped.
+        """
+        def hull(first: typing.Tuple[int, int],
+                 second: typing.Tuple[int, int]) -> typing.Tuple[int, int]:
+            low, high = min(first[0], second[0]), max(first[1], second[1])
+            if widen:
+                low = MIN_VALUE if low < first[0] else low
+                high = MAX_VALUE if high > first[1] else high
+            return low, high
+
+        depth = min(len(self.stack), len(other.stack))
+        stack = []
+        for mine, theirs in zip(self.stack[len(self.stack) - depth:],
+                                other.stack[len(other.stack) - depth:]):
+            low, high = hull((mine.low, mine.high), (theirs.low, theirs.high))
+            stack.append(Value(
+                low, high, mine.cell if mine.cell == theirs.cell else None,
+                mine.condition if mine.condition == theirs.condition
+                else None))
+        cells = {cell: hull(bounds, other.cells[cell])
+                 for cell, bounds in self.cells.items() if cell in other.cells}
+        return State(stack, cells)
+
+
+class RangeAnalysis:
+    """Interval analysis of the VM commands of a single function. Finds the
+    "gt" and "lt" commands whose operands are bounded so that subtracting
+    them cannot overflow."""
+
+    def __init__(self, commands: typing.List[Command]) -> None:
+        """
+        Args:
+            commands: (command type, arg1, arg2) of each command of the
+            function, starting with its "function" command (if any).
+        """
+        self.commands = commands
+        self.labels = {arg1: index for index, (command_type, arg1, arg2)
+                       in enumerate(commands) if command_type == C_LABEL}
+        self.label_states: typing.Dict[int, State] = {}
+        self.label_updates: typing.Dict[int, int] = {}
+        self.worklist: typing.List[int] = []
+        self.safe_comparisons: typing.Set[int] = set()
+
+    def run(self) -> typing.Set[int]:
+        """
+        Returns:
+            typing.Set[int]: the indices of the comparisons that cannot
+            overflow.
+        """
+        self.walk(0, State(), record=False)
+        while self.worklist:
+            index = self.worklist.pop()
+            self.walk(index, self.label_states[index].copy(), record=False)
+        # All label states are final now, so each comparison is judged once,
+        # in the walk from the closest label above it.
+        self.walk(0, State(), record=True)
+        for index, state in self.label_states.items():
+            self.walk(index, state.copy(), record=True)
+        return self.safe_comparisons
+
+    def send(self, index: int, state: State) -> None:
+        """Joins a state into the state of the label at the given index."""
+        old_state = self.label_states.get(index)
+        if old_state is None:
+            new_state = state.copy()
+        else:
+            updates = self.label_updates.get(index, 0) + 1
+            self.label_updates[index] = updates
+            new_state = old_state.join(
+                state, widen=updates > WIDENING_THRESHOLD)
+            if new_state == old_state:
+                return
+        self.label_states[index] = new_state
+        if index not in self.worklist:
+            self.worklist.append(index)
+
+    def walk(self, start: int, state: State, record: bool) -> None:
+        """Runs the commands from start in the abstract, until control leaves
+        the straight-line code (a label, a jump or a return).
+
+        Args:
+            start (int): the index to start from.
+            state (State): the state before that command.
+            record (bool): only records safe comparisons (and does not update
+            label states) if set.
+        """
+        for index in range(start, len(self.commands)):
+            command_type, arg1, arg2 = self.commands[index]
+            if command_type == C_LABEL and index != start:
+                if not record:
+                    self.send(index, state)
+                return
+            elif command_type == C_FUNCTION:
+                state = State(cells={('local', i): (0, 0)
+                                     for i in range(arg2)})
+            elif command_type == C_PUSH:
+                if arg1 == 'constant':
+                    state.push(Value(arg2, arg2))
+                elif arg1 in TRACKED_SEGMENTS:
+                    state.push(state.load((arg1, arg2)))
+                else:
+                    state.push(TOP)
+            elif command_type == C_POP:
+                value = state.pop()
+                if arg1 in TRACKED_SEGMENTS:
+                    state.store((arg1, arg2), value)
+            elif command_type == C_ARITHMETIC:
+                if self.arithmetic(state, arg1) and record:
+                    self.safe_comparisons.add(index)
+            elif command_type == C_CALL:
+                for i in range(arg2):
+                    state.pop()
+                state.forget(lambda cell: cell[0] in CALL_CLOBBERED_SEGMENTS)
+                state.push(TOP)
+            elif command_type == C_GOTO:
+                if not record and arg1 in self.labels:
+                    self.send(self.labels[arg1], state)
+                return
+            elif command_type == C_IF:
+                value = state.pop()
+                jump_state, may_jump = state.copy(), value != Value(0, 0)
+                may_fall = value.low <= 0 <= value.high
+                if value.condition is not None:
+                    may_jump = may_jump and jump_state.refine(
+                        value.condition, True)
+                    may_fall = may_fall and state.refine(value.condition, False)
+                if may_jump and not record and arg1 in self.labels:
+                    self.send(self.labels[arg1], jump_state)
+                if not may_fall:
+                    return
+            elif command_type == C_RETURN:
+                return
+
+    @staticmethod
+    def arithmetic(state: State, command: str) -> bool:
+        """Applies an arithmetic command to the state.
+
+        Returns:
+            bool: True if the command is a comparison that cannot overflow.
+        """
+        y = state.pop()
+        if command == 'neg':
+            state.push(interval(-y.high, -y.low))
+        elif command == 'not':
+            result = Value(-y.high - 1, -y.low - 1)
+            if y.condition is not None:
+                cell, relation, low, high, negated = y.condition
+                result = result._replace(
+                    condition=(cell, relation, low, high, not negated))
+            state.push(result)
+        elif command == 'shiftleft':
+            state.push(interval(2 * y.low, 2 * y.high))
+        elif command == 'shiftright':
+            # Rounds towards zero, but negating -32768 first overflows.
+            state.push(TOP if y.low == MIN_VALUE
+                       else Value(int(y.low / 2), int(y.high / 2)))
+        else:
+            x = state.pop()
+            if command == 'add':
+                state.push(interval(x.low + y.low, x.high + y.high))
+            elif command == 'sub':
+                state.push(interval(x.low - y.high, x.high - y.low))
+            elif command == 'and' and (x.low >= 0 or y.low >= 0):
+                state.push(Value(0, min(
+                    value.high for value in [x, y] if value.low >= 0)))
+            elif command in ['and', 'or']:
+                if x.low >= 0 and y.low >= 0:
+                    state.push(Value(
+                        0, (1 << max(x.high, y.high).bit_length()) - 1))
+                elif BOOLEAN.low <= min(x.low, y.low) and \
+                        max(x.high, y.high) <= BOOLEAN.high:
+                    state.push(BOOLEAN)
+                else:
+                    state.push(TOP)
+            elif command in FLIPPED:
+                condition = None
+                if x.cell is not None and x.cell != y.cell:
+                    condition = (x.cell, command, y.low, y.high, False)
+                elif y.cell is not None and y.cell != x.cell:
+                    condition = (y.cell, FLIPPED[command], x.low, x.high, False)
+                state.push(BOOLEAN._replace(condition=condition))
+                return comparison_is_safe(x, y)
+            elif command == 'mul':
+                products = [a * b for a in [x.low, x.high]
+                            for b in [y.low, y.high]]
+                state.push(interval(min(products), max(products)))
+            elif command == 'div' and y.low > 0:
+                # Rounds towards zero.
+                quotients = [int(a / b) for a in [x.low, x.high]
+                             for b in [y.low, y.high]]
+                state.push(interval(min(quotients), max(quotients)))
+            else:
+                state.push(TOP)
+        return False
+
+
+def safe_comparisons(commands: typing.List[Command]) -> typing.Set[int]:
+    """Runs the analysis over a single function.
+
+    Args:
+        commands (typing.List[Command]): the commands of the function,
+        starting with its "function" command (if any).
+
+    Returns:
+        typing.Set[int]: the indices (in commands) of the "gt" and "lt"
+        commands that cannot overflow.
+    """
+    return RangeAnalysis(commands).run()
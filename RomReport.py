@@ -0,0 +1,162 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+ROM_SIZE = 32768
+ROM_WARNING_RATIO = 0.9
+
+
+def parse_instructions(
+        assembly_command: str) -> typing.Tuple[typing.List[str],
+                                               typing.Dict[str, int]]:
+    """Splits a piece of assembly code into its instructions and labels.
+
+    Args:
+        assembly_command (str): assembly code, as passed to write_asm.
+
+    Returns:
+        typing.Tuple[typing.List[str], typing.Dict[str, int]]: the
+        instructions without comments or whitespace, and the index of the
+        instruction each label points to.
+    """
+    instructions = []
+    labels = {}
+    for line in assembly_command.split('\n'):
+        comment_index = line.find('//')
+        if comment_index != -1:
+            line = line[:comment_index]
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('('):
+            labels[line[1:line.index(')')].strip()] = len(instructions)
+        else:
+            instructions.append(line)
+    return instructions, labels
+
+
+def estimate_cycles(assembly_command: str) -> typing.Tuple[int, int, bool]:
+    """Statically estimates the cost of a piece of assembly code. The Hack CPU
+    executes one instruction per cycle, so the cycle estimate is the longest
+    path through the code that does not take a backward jump.
+    Jumps to labels outside of the code leave it.
+
+    Args:
+        assembly_command (str): assembly code, as passed to write_asm.
+
+    Returns:
+        typing.Tuple[int, int, bool]: the number of instructions, the
+        estimated cycles and whether the code contains a loop (in which case
+        the estimate covers a single iteration).
+    """
+    instructions, labels = parse_instructions(assembly_command)
+    has_loop = False
+    # longest_path[i] = the longest path from instruction i to the end.
+    longest_path = [0] * (len(instructions) + 1)
+    for index in range(len(instructions) - 1, -1, -1):
+        instruction = instructions[index]
+        successors = [index + 1]
+        if ';' in instruction:
+            if instruction.endswith('JMP'):
+                successors = []
+            previous = instructions[index - 1] if index > 0 else ''
+            target = labels.get(previous[1:]) if previous.startswith('@') \
+                else None
+            if target is not None:
+                if target <= index:
+                    has_loop = True
+                else:
+                    successors.append(target)
+        longest_path[index] = 1 + max(
+            (longest_path[successor] for successor in successors), default=0)
+    return len(instructions), longest_path[0], has_loop
+
+
+class RomReport:
+    """Collects the size and the static cycle cost of the emitted assembly
+    code, per VM function and per VM command type."""
+
+    def __init__(self) -> None:
+        """Initializes an empty report."""
+        self.function_sizes: typing.Dict[str, int] = {}
+        # command -> [occurrences, instructions, cycles, has_loop]
+        self.command_costs: typing.Dict[str, list] = {}
+
+    def record(self, function_name: str, command_name: str,
+               assembly_command: str) -> None:
+        """Records the assembly code emitted for a single VM command.
+
+        Args:
+            function_name (str): the VM function the command belongs to.
+            command_name (str): the command type, e.g. "eq" or "push local".
+            assembly_command (str): the emitted assembly code.
+        """
+        size, cycles, has_loop = estimate_cycles(assembly_command)
+        self.function_sizes[function_name] = \
+            self.function_sizes.get(function_name, 0) + size
+        costs = self.command_costs.setdefault(command_name, [0, 0, 0, False])
+        costs[0] += 1
+        costs[1] += size
+        costs[2] = max(costs[2], cycles)
+        costs[3] = costs[3] or has_loop
+
+    def total_size(self) -> int:
+        """
+        Returns:
+            int: the total number of emitted instructions.
+        """
+        return sum(self.function_sizes.values())
+
+    def rom_warning(self) -> typing.Optional[str]:
+        """
+        Returns:
+            typing.Optional[str]: a warning if the emitted code is close to (or
+            over) the size of the ROM, None otherwise.
+        """
+        total = self.total_size()
+        if total > ROM_SIZE:
+            return f"warning: {total} instructions do not fit in the " \
+                   f"{ROM_SIZE} words of ROM"
+        if total >= ROM_SIZE * ROM_WARNING_RATIO:
+            return f"warning: {total} instructions use " \
+                   f"{100 * total / ROM_SIZE:.1f}% of the {ROM_SIZE} words " \
+                   f"of ROM"
+        return None
+
+    def format(self, top: int = 5) -> str:
+        """Formats the report as text. The largest contributors to the ROM
+        size are marked with a "*".
+
+        Args:
+            top (int): how many functions / commands to mark.
+
+        Returns:
+            str: the report.
+        """
+        total = self.total_size()
+        lines = [f"ROM usage: {total} / {ROM_SIZE} words "
+                 f"({100 * total / ROM_SIZE:.1f}%)", "",
+                 f"  {'function':<40}{'words':>8}{'share':>8}"]
+        functions = sorted(self.function_sizes.items(),
+                           key=lambda item: item[1], reverse=True)
+        for rank, (function_name, size) in enumerate(functions):
+            mark = '*' if rank < top else ' '
+            lines.append(f"{mark} {function_name:<40}{size:>8}"
+                         f"{100 * size / max(total, 1):>7.1f}%")
+        lines += ["", f"  {'command':<20}{'count':>8}{'words':>8}"
+                      f"{'each':>6}{'cycles':>8}"]
+        commands = sorted(self.command_costs.items(),
+                          key=lambda item: item[1][1], reverse=True)
+        for rank, (command_name, costs) in enumerate(commands):
+            count, size, cycles, has_loop = costs
+            mark = '*' if rank < top else ' '
+            cycles_text = f"{cycles}+" if has_loop else f"{cycles}"
+            lines.append(f"{mark} {command_name:<20}{count:>8}{size:>8}"
+                         f"{size // count:>6}{cycles_text:>8}")
+        lines += ["", "cycles: longest straight-line path through one "
+                      "command, \"+\" marks a loop (one iteration counted)"]
+        return '\n'.join(lines)
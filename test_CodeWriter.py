@@ -0,0 +1,339 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import io
+import random
+import typing
+import unittest
+import HackSimulator
+import Main
+from CodeWriter import CodeWriter
+MAX_CYCLES = 10000000
+STACK_BASE = 256
+# Operands around the edges of the 16 bit range and of the routines' loops.
+EDGE_OPERANDS = [0, 1, -1, 2, -2, 3, -3, 7, 100, -100, 181, 255, -256,
+                 16384, -16384, 32767, -32767, -32768]
+
+# Runs Main.main with the given argument, and keeps its result in static 0
+# and the THAT it returns to in static 1.
+SYS = """function Sys.init 0
+    push constant 7
+    pop pointer 1
+    push constant {argument}
+    call Main.main 1
+    pop static 0
+    push pointer 1
+    pop static 1
+    label HALT
+    goto HALT
+    """
+
+
+def translate(sources: typing.Dict[str, str],
+              code_writer_factory: typing.Callable[[typing.TextIO], CodeWriter]
+              = CodeWriter) -> str:
+    """Translates a program made of the given files, with a bootstrap.
+
+    Args:
+        sources (typing.Dict[str, str]): the code of each file, by file name.
+        code_writer_factory: creates the code writer for the output stream.
+
+    Returns:
+        str: the assembly code.
+    """
+    output_file = io.StringIO()
+    code_writer = code_writer_factory(output_file)
+    code_writer.write_init()
+    for name, source in sources.items():
+        input_file = io.StringIO(source)
+        input_file.name = name + ".vm"
+        Main.translate_file(input_file, output_file, code_writer)
+    return output_file.getvalue()
+
+
+def run_program(assembly_code: str) -> typing.Dict[int, int]:
+    """
+    Returns:
+        typing.Dict[int, int]: the RAM after the program halts.
+    """
+    ram = {}
+    HackSimulator.run(HackSimulator.assemble(assembly_code), ram, MAX_CYCLES)
+    return ram
+
+
+def stack_peak(ram: typing.Dict[int, int]) -> int:
+    """
+    Returns:
+        int: the highest stack address that was written.
+    """
+    return max(address for address in ram if STACK_BASE <= address < 2048)
+
+
+class CallTest(unittest.TestCase):
+    """Runs calls, returns and tail calls in HackSimulator."""
+
+    def run_main(self, main: str, argument: int) -> typing.Dict[int, int]:
+        return run_program(translate(
+            {"Sys": SYS.format(argument=argument), "Main": main}))
+
+    def test_call_and_return(self) -> None:
+        ram = self.run_main("""function Main.main 1
+            push argument 0
+            push constant 2
+            call Main.add 2
+            pop local 0
+            push local 0
+            push constant 1
+            add
+            return
+            function Main.add 0
+            push argument 0
+            push argument 1
+            add
+            return
+            """, 40)
+        self.assertEqual(ram[16], 43)
+        self.assertEqual(ram[17], 7)
+        # Back in Sys.init, whose frame takes 5 words.
+        self.assertEqual(ram[0], STACK_BASE + 5)
+
+    def test_tail_recursion_same_arg_count(self) -> None:
+        # Main.count(n, total) adds 2 to total n times.
+        ram = self.run_main("""function Main.main 0
+            push argument 0
+            push constant 0
+            call Main.count 2
+            return
+            function Main.count 1
+            push argument 0
+            push constant 0
+            eq
+            if-goto DONE
+            push argument 0
+            push constant 1
+            sub
+            push argument 1
+            push constant 2
+            add
+            call Main.count 2
+            return
+            label DONE
+            push argument 1
+            return
+            """, 1000)
+        self.assertEqual(ram[16], 2000)
+        # 1000 plain calls would take over 8 words of stack each.
+        self.assertLess(stack_peak(ram), STACK_BASE + 50)
+
+    def test_mutual_tail_recursion_different_arg_count(self) -> None:
+        # Main.even takes 1 argument and Main.odd 2, so every tail call
+        # rebuilds the frame header.
+        ram = self.run_main("""function Main.main 0
+            push argument 0
+            call Main.even 1
+            return
+            function Main.even 1
+            push argument 0
+            push constant 0
+            eq
+            if-goto TRUE
+            push argument 0
+            push constant 1
+            sub
+            push constant 99
+            call Main.odd 2
+            return
+            label TRUE
+            push constant 1
+            return
+            function Main.odd 2
+            push argument 0
+            push constant 0
+            eq
+            if-goto FALSE
+            push argument 0
+            push constant 1
+            sub
+            call Main.even 1
+            return
+            label FALSE
+            push constant 0
+            return
+            """, 501)
+        self.assertEqual(ram[16], 0)
+        self.assertLess(stack_peak(ram), STACK_BASE + 50)
+
+    def test_tail_call_keeps_this_and_that(self) -> None:
+        # The callee starts with the current THIS and THAT, whether the frame
+        # is reused (Main.same) or rebuilt (Main.other), and the caller gets
+        # back its own.
+        for callee, n_args in [("Main.same", 1), ("Main.other", 2)]:
+            ram = self.run_main(f"""function Main.main 0
+                push constant 1234
+                pop pointer 1
+                push constant 4321
+                pop pointer 0
+                push constant 5
+                push constant 6
+                call {callee} {n_args}
+                return
+                function Main.same 0
+                push pointer 1
+                push pointer 0
+                sub
+                return
+                function Main.other 0
+                push pointer 1
+                push pointer 0
+                sub
+                return
+                """, 0)
+            self.assertEqual(ram[16], 1234 - 4321, callee)
+            self.assertEqual(ram[17], 7, callee)
+
+
+# VM versions of the OS algorithms, which --fast-math replaces: multiply
+# adds over all 16 bits of y, and divide (for x >= 0 and y > 0) recurses on
+# 2 * y.
+MATH = """function Math.multiply 3
+    push argument 0
+    pop local 1
+    push constant 1
+    pop local 2
+    label LOOP
+    push local 2
+    push constant 0
+    eq
+    if-goto END
+    push argument 1
+    push local 2
+    and
+    push constant 0
+    eq
+    if-goto SKIP
+    push local 0
+    push local 1
+    add
+    pop local 0
+    label SKIP
+    push local 1
+    push local 1
+    add
+    pop local 1
+    push local 2
+    push local 2
+    add
+    pop local 2
+    goto LOOP
+    label END
+    push local 0
+    return
+    function Math.divide 1
+    push argument 1
+    push argument 0
+    gt
+    push argument 1
+    push constant 0
+    lt
+    or
+    if-goto ZERO
+    push argument 0
+    push argument 1
+    push argument 1
+    add
+    call Math.divide 2
+    pop local 0
+    push argument 0
+    push local 0
+    push local 0
+    add
+    push argument 1
+    call Math.multiply 2
+    sub
+    push argument 1
+    lt
+    if-goto EVEN
+    push local 0
+    push local 0
+    add
+    push constant 1
+    add
+    return
+    label EVEN
+    push local 0
+    push local 0
+    add
+    return
+    label ZERO
+    push constant 0
+    return
+    """
+
+
+def push_constant(value: int) -> str:
+    return f"push constant {abs(value)}\n" + ("neg\n" if value < 0 else "")
+
+
+class FastMathTest(unittest.TestCase):
+    """Runs the mul and div routines in HackSimulator."""
+
+    def operands(self, divisor: bool) -> typing.List[typing.Tuple[int, int]]:
+        generator = random.Random(31)
+        pairs = [(x, y) for x in EDGE_OPERANDS for y in EDGE_OPERANDS]
+        pairs += [(generator.randint(-32768, 32767),
+                   generator.randint(-32768, 32767)) for pair in range(108)]
+        return [(x, y) for x, y in pairs if y != 0 or not divisor]
+
+    def assert_computes(self, command: str,
+                        expected: typing.Callable[[int, int], int]) -> None:
+        output_file = io.StringIO()
+        CodeWriter(output_file).write_arithmetic(command)
+        program = HackSimulator.assemble(output_file.getvalue())
+        for x, y in self.operands(command == 'div'):
+            ram = {0: STACK_BASE + 2, STACK_BASE: x, STACK_BASE + 1: y}
+            HackSimulator.run(program, ram, MAX_CYCLES)
+            self.assertEqual(ram[0], STACK_BASE + 1)
+            self.assertEqual(ram[STACK_BASE],
+                             HackSimulator.to_signed(expected(x, y)),
+                             f"{x} {command} {y}")
+
+    def test_multiply(self) -> None:
+        self.assert_computes('mul', lambda x, y: x * y)
+
+    def test_divide(self) -> None:
+        # Rounds towards zero, and -32768 / -1 wraps around to -32768.
+        self.assert_computes(
+            'div', lambda x, y: (abs(x) // abs(y)) * (-1 if x * y < 0 else 1))
+
+    def test_faster_than_os_algorithms(self) -> None:
+        # Runs the same calls with the VM versions of the OS algorithms and
+        # with --fast-math, which should get the same results in a small
+        # fraction of the cycles.
+        generator = random.Random(31)
+        for function_name, low in [("Math.multiply", -32768),
+                                   ("Math.divide", 0)]:
+            source = "function Sys.init 0\n"
+            for static in range(20):
+                source += push_constant(generator.randint(low, 32767)) + \
+                    push_constant(generator.randint(1, 200)) + \
+                    f"call {function_name} 2\npop static {static}\n"
+            source += "label HALT\ngoto HALT\n"
+            results, cycles = [], []
+            for fast_math in [False, True]:
+                ram = {}
+                cycles.append(HackSimulator.run(HackSimulator.assemble(
+                    translate({"Sys": source, "Math": MATH},
+                              lambda output: CodeWriter(
+                                  output, fast_math=fast_math))),
+                    ram, MAX_CYCLES))
+                results.append([ram.get(16 + static) for static in range(20)])
+            self.assertEqual(results[0], results[1], function_name)
+            self.assertLess(10 * cycles[1], cycles[0], function_name)
+
+
+if "__main__" == __name__:
+    unittest.main()
@@ -0,0 +1,144 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import io
+import os
+import tempfile
+import typing
+import unittest
+import HackSimulator
+from CodeWriter import CodeWriter
+from Profile import Profile, PROFILE_BASE, dump_counters
+from RomReport import parse_instructions
+from test_CodeWriter import SYS, MAX_CYCLES, translate, run_program
+
+# Main.hot runs in a loop, the other functions once, so the profile-use
+# build shares the gt, lt and call code of the cold ones.
+MAIN = """function Main.main 1
+    label LOOP
+    push local 0
+    push argument 0
+    lt
+    not
+    if-goto END
+    push local 0
+    push argument 0
+    call Main.hot 2
+    pop static 2
+    push local 0
+    push constant 1
+    add
+    pop local 0
+    goto LOOP
+    label END
+    push argument 0
+    push constant 3
+    call Main.cold 2
+    push argument 0
+    push constant 30000
+    neg
+    call Main.cold 2
+    add
+    push argument 0
+    neg
+    push argument 0
+    call Main.cold 2
+    add
+    return
+    function Main.hot 0
+    push argument 0
+    push argument 1
+    gt
+    return
+    function Main.cold 0
+    push argument 0
+    push argument 1
+    gt
+    push argument 1
+    push argument 0
+    lt
+    add
+    push argument 0
+    push argument 1
+    lt
+    sub
+    push argument 1
+    push argument 0
+    gt
+    add
+    return
+    """
+# The statics and the pointers, but not R13-R15 or the stack, which hold
+# leftover ROM addresses that differ between builds.
+COMPARED_ADDRESSES = list(range(13)) + list(range(16, 256))
+
+
+def size(assembly_code: str) -> int:
+    return len(parse_instructions(assembly_code)[0])
+
+
+class ProfileTest(unittest.TestCase):
+    """Runs the --profile-generate, Profile.py and --profile-use steps on a
+    program in HackSimulator."""
+
+    def results(self, assembly_code: str) -> typing.List[int]:
+        ram = run_program(assembly_code)
+        return [ram.get(address, 0) for address in COMPARED_ADDRESSES]
+
+    def test_workflow(self) -> None:
+        sources = {"Sys": SYS.format(argument=1000), "Main": MAIN}
+        plain = translate(sources)
+        generating = Profile()
+        instrumented = translate(
+            sources, lambda output: CodeWriter(output, None, generating))
+        with tempfile.TemporaryDirectory() as directory:
+            asm_path = os.path.join(directory, "Main.asm")
+            with open(asm_path, 'w') as asm_file:
+                asm_file.write(instrumented)
+            generating.write_sites(os.path.join(directory, "Main.sites"))
+            profile = Profile.read(dump_counters(asm_path, MAX_CYCLES, {}))
+        self.assertEqual(profile.counts["Main.hot#1 gt"], 1000)
+        self.assertEqual(profile.counts["Main.cold#1 gt"], 3)
+        optimized = translate(
+            sources, lambda output: CodeWriter(output, None, profile))
+        for routine in ["SHARED_GT", "SHARED_LT", "SHARED_CALL"]:
+            self.assertTrue(f"({routine})" in optimized, routine)
+        self.assertEqual(self.results(plain), self.results(instrumented))
+        self.assertEqual(self.results(plain), self.results(optimized))
+        self.assertLessEqual(size(optimized), size(plain))
+
+    def test_shared_routine_pays_off(self) -> None:
+        # Each cold call saves 35 words, and the shared routine takes 52.
+        for cold_calls, shared in [(1, False), (2, True)]:
+            counts = {f"Test#{site} call Test.cold": 1
+                      for site in range(1, cold_calls + 1)}
+            counts[f"Test#{cold_calls + 1} call Test.hot"] = 1000
+            source = cold_calls * "call Test.cold 0\npop temp 0\n" + \
+                "call Test.hot 0\npop temp 0\n"
+            plain = translate({"Test": source})
+            output_file = io.StringIO()
+            code_writer = CodeWriter(output_file, None, Profile(counts))
+            translate({"Test": source}, lambda output: code_writer)
+            optimized = output_file.getvalue()
+            self.assertEqual(code_writer.shared_routine_pays_off("call"),
+                             shared)
+            self.assertEqual("(SHARED_CALL)" in optimized, shared)
+            self.assertLessEqual(size(optimized), size(plain))
+
+    def test_counters_saturate(self) -> None:
+        code_writer = CodeWriter(io.StringIO(), None, Profile())
+        code_writer.set_file_name("Test")
+        counter, hot = code_writer.profile_site("gt")
+        program = HackSimulator.assemble(counter)
+        for count, expected in [(0, 1), (5, 6), (65534, -1), (-1, -1)]:
+            ram = {PROFILE_BASE: count}
+            HackSimulator.run(program, ram, MAX_CYCLES)
+            self.assertEqual(ram[PROFILE_BASE], expected)
+
+
+if "__main__" == __name__:
+    unittest.main()
@@ -0,0 +1,181 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import io
+import random
+import typing
+import unittest
+from unittest import mock
+import HackSimulator
+import Main
+from Parser import C_ARITHMETIC
+from RangeAnalysis import Command, safe_comparisons
+
+# The programs are single functions that start at address 0, with the stack
+# and LCL at 300 and their arguments at 256.
+INITIAL_RAM = {0: 300, 1: 300, 2: 256, 256: 12345, 257: -20000}
+MAX_CYCLES = 1000000
+
+
+def all_comparisons(commands: typing.List[Command]) -> typing.Set[int]:
+    # Pretends that no comparison can overflow.
+    return {index for index, (command_type, arg1, arg2) in enumerate(commands)
+            if command_type == C_ARITHMETIC and arg1 in ['eq', 'gt', 'lt']}
+
+
+class RangeAnalysisTest(unittest.TestCase):
+    """Translates programs with and without the range analysis, runs both in
+    HackSimulator and compares the statics and locals they end with."""
+
+    def translate(self, source: str,
+                  analysis: typing.Optional[typing.Callable] = None) -> str:
+        input_file = io.StringIO(source)
+        input_file.name = "Test.vm"
+        output_file = io.StringIO()
+        with mock.patch.object(
+                Main, 'safe_comparisons', analysis or safe_comparisons):
+            Main.translate_file(input_file, output_file)
+        return output_file.getvalue()
+
+    def run_program(self, assembly_code: str) -> typing.Dict[int, int]:
+        ram = dict(INITIAL_RAM)
+        HackSimulator.run(HackSimulator.assemble(assembly_code), ram,
+                          MAX_CYCLES)
+        return {address: ram.get(address, 0)
+                for address in list(range(16, 32)) + list(range(300, 310))}
+
+    def assert_same_results(self, source: str) -> None:
+        self.assertEqual(
+            self.run_program(self.translate(source)),
+            self.run_program(self.translate(source, lambda commands: set())),
+            source)
+
+    def analyze(self, source: str) -> typing.Set[int]:
+        # The commands of the function, as the translation buffers them.
+        functions = []
+        self.translate(
+            source, lambda commands: functions.append(commands) or set())
+        return safe_comparisons(functions[0])
+
+    def test_bounded_loop_counter(self) -> None:
+        source = """function Test.main 2
+            label LOOP
+            push local 0
+            push constant 10
+            lt
+            not
+            if-goto END
+            push local 0
+            push constant 1
+            add
+            pop local 0
+            goto LOOP
+            label END
+            push local 0
+            pop static 0
+            label HALT
+            goto HALT
+            """
+        self.assertEqual(self.analyze(source), {4})
+        self.assert_same_results(source)
+
+    def test_widened_counter_overflowing_gt(self) -> None:
+        # local 0 grows by 1000 while local 1 counts to 40, so its range is
+        # widened and "local 0 gt -30000" overflows for local 0 > 2767.
+        source = """function Test.main 3
+            label LOOP
+            push local 1
+            push constant 40
+            lt
+            not
+            if-goto END
+            push local 2
+            push local 0
+            push constant 30000
+            neg
+            gt
+            sub
+            pop local 2
+            push local 0
+            push constant 1000
+            add
+            pop local 0
+            push local 1
+            push constant 1
+            add
+            pop local 1
+            goto LOOP
+            label END
+            push local 2
+            pop static 0
+            label HALT
+            goto HALT
+            """
+        self.assertEqual(self.analyze(source), {4})
+        self.assert_same_results(source)
+        self.assertEqual(self.run_program(self.translate(source))[16], 37)
+        # Trusting the overflowing comparison does change the result.
+        self.assertNotEqual(
+            self.run_program(self.translate(source)),
+            self.run_program(self.translate(source, all_comparisons)))
+
+    def test_long_function_is_not_analyzed(self) -> None:
+        source = """function Test.main 1
+            label LOOP
+            push local 0
+            push constant 10
+            lt
+            not
+            if-goto END
+            push local 0
+            push constant 1
+            add
+            pop local 0
+            goto LOOP
+            label END
+            """
+        with mock.patch.object(Main, 'MAX_ANALYZED_COMMANDS', 5):
+            self.assertEqual(self.translate(source),
+                             self.translate(source, lambda commands: set()))
+
+    def test_random_programs(self) -> None:
+        generator = random.Random(8)
+        for program in range(200):
+            lines = ["function Test.main 4"]
+            depth = 0
+            for command in range(30):
+                choice = generator.random()
+                if depth < 2 or choice < 0.3:
+                    value = generator.choice(
+                        [0, 1, 2, 100, 16384, 32767,
+                         generator.randint(0, 32767)])
+                    lines.append(f"push constant {value}")
+                    if generator.random() < 0.3:
+                        lines.append("neg")
+                    depth += 1
+                elif choice < 0.45:
+                    segment = generator.choice(['local', 'argument'])
+                    lines.append(f"push {segment} {generator.randint(0, 1)}")
+                    depth += 1
+                elif choice < 0.55:
+                    lines.append(f"pop local {generator.randint(0, 3)}")
+                    depth -= 1
+                elif choice < 0.65:
+                    lines.append(generator.choice(['neg', 'not']))
+                else:
+                    lines.append(generator.choice(
+                        ['add', 'sub', 'and', 'or', 'eq', 'gt', 'lt', 'gt',
+                         'lt']))
+                    depth -= 1
+            for static in range(depth):
+                lines.append(f"pop static {static}")
+            lines += ["label HALT", "goto HALT"]
+            self.assert_same_results("\n".join(lines) + "\n")
+
+
+if "__main__" == __name__:
+    unittest.main()